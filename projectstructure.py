@@ -1,4 +1,3 @@
-import os
 from pathlib import Path
 
 
@@ -34,10 +33,10 @@ list_of_files = [
 
 for filepath in list_of_files:
     filepath = Path(filepath)
-    filedir, filename = os.path.split(filepath)
-
-    if filedir != "":
-        os.makedirs(filedir, exist_ok=True)
-    if not os.path.exists(filepath):
-        with open(filepath, "w") as f:
-            pass
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    # Exclusive create: one syscall, and existing files keep their contents
+    # and mtime (touch() would bump the mtime)
+    try:
+        filepath.open("x").close()
+    except FileExistsError:
+        pass
@@ -1,29 +1,43 @@
 # rag_app/app/chat_interface.py
 
 import streamlit as st
-import uuid  # Import uuid for session ID generation
+import time
+import collections
 # --- Use ABSOLUTE imports for backend logic ---
 from utils.langchain_utils import get_cached_rag_chain, RAGChainInitializationError
 from utils.db_utils import get_chat_history, insert_application_logs
+from utils.semantic_cache import get_semantic_cache, embed_prompt
 from pipeline.logger import logger
 # --- --- --- --- --- --- --- --- --- --- ---
 
+# Minimum seconds between placeholder re-renders while streaming
+STREAM_FLUSH_INTERVAL = 0.05
+# Also flush after this many buffered chunks, regardless of elapsed time
+STREAM_FLUSH_CHUNKS = 16
+# Expanding history window (in messages): grows from MIN up to MAX, then resets
+# to the newest MIN, so the prompt prefix stays identical across most turns
+# and the LLM provider's prefix prompt cache can be reused.
+HISTORY_WINDOW_MIN = 10
+HISTORY_WINDOW_MAX = 20
+
+# Session state defaults. Values are factories so mutable defaults are never
+# shared between sessions. session_id is initialized in streamlit_app.py.
+SESSION_DEFAULTS = {
+    "nomic_api_key": str,
+    "groq_api_key": str,
+    "model": lambda: "llama-3.1-8b-instant",
+    "messages": lambda: [
+        {"role": "assistant", "content": "Hello! How can I help you today?"}],
+    "history_buf": collections.deque,
+}
+
 
 def display_chat_interface():
     logger.debug("Displaying chat interface")
-    # Ensure necessary keys are in session state
-    if "nomic_api_key" not in st.session_state:
-        st.session_state.nomic_api_key = ""
-    if "groq_api_key" not in st.session_state:
-        st.session_state.groq_api_key = ""
-    if "model" not in st.session_state:
-        st.session_state.model = "llama-3.1-8b-instant"
-    if "session_id" not in st.session_state:
-        st.session_state.session_id = str(
-            uuid.uuid4())  # Generate initial session ID
-    if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {"role": "assistant", "content": "Hello! How can I help you today?"}]
+    # Ensure necessary keys are in session state (factories run only when missing)
+    for key, default_factory in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = default_factory()
 
     # Display chat history
     for message in st.session_state.messages:
@@ -32,12 +46,14 @@ def display_chat_interface():
 
     # Handle new user input
     if prompt := st.chat_input("Enter your query here..."):
-        logger.info(f"User input received: {prompt}")
-        # Check for API Keys first
-        if not st.session_state.nomic_api_key or not st.session_state.groq_api_key:
+        # Check for API Keys first, before any logging or state mutation
+        nomic_api_key = st.session_state.nomic_api_key
+        groq_api_key = st.session_state.groq_api_key
+        if not (nomic_api_key and groq_api_key):
             st.warning(
                 "Please enter both Nomic and Groq API keys in the sidebar to enable chat.")
             return  # Stop processing if keys are missing
+        logger.info("User input received: %s", prompt)
 
         # Add user message to state and display it
         st.session_state.messages.append({"role": "user", "content": prompt})
@@ -50,59 +66,102 @@ def display_chat_interface():
 
         with st.chat_message("assistant"):
             message_placeholder = st.empty()  # Create placeholder for streaming/final answer
-            with st.spinner("Thinking..."):
-                try:
-                    # Get RAG chain (uses cache)
-                    rag_chain = get_cached_rag_chain(
-                        selected_model,
-                        st.session_state.nomic_api_key,
-                        st.session_state.groq_api_key
-                    )
-
-                    if rag_chain:
-                        logger.info(
-                            f"Invoking RAG chain for session {session_id}")
-                        # Get chat history for the chain
-                        chat_history = get_chat_history(session_id)
+            message_placeholder.markdown("Thinking...")
+            try:
+                # Get RAG chain (uses cache)
+                rag_chain = get_cached_rag_chain(
+                    selected_model,
+                    nomic_api_key,
+                    groq_api_key
+                )
 
-                        # --- Invoke RAG chain DIRECTLY ---
-                        response = rag_chain.invoke({
+                if rag_chain:
+                    # History comes from the in-memory buffer; the DB is only
+                    # read on cold start, when earlier turns exist but the
+                    # buffer is empty (messages = greeting + prompt on turn one)
+                    history_buf = st.session_state.history_buf
+                    if not history_buf and len(st.session_state.messages) > 2:
+                        history_buf.extend(get_chat_history(session_id))
+                    if len(history_buf) >= HISTORY_WINDOW_MAX:
+                        # Reset window: drop the oldest messages in one step
+                        # instead of sliding by one turn every time
+                        while len(history_buf) > HISTORY_WINDOW_MIN:
+                            history_buf.popleft()
+                    chat_history = list(history_buf)
+
+                    # --- Semantic cache: skip retrieval + LLM on repeated questions ---
+                    # Only standalone questions (no chat history) are cached: their
+                    # answer depends on the prompt, the model and the indexed
+                    # documents alone, and follow-up turns skip the embedding call.
+                    semantic_cache = get_semantic_cache()
+                    query_vec = embed_prompt(
+                        prompt, nomic_api_key) if not chat_history else None
+                    answer = semantic_cache.lookup(
+                        selected_model, query_vec) if query_vec is not None else None
+
+                    if answer is not None:
+                        logger.info(
+                            "Semantic cache hit for session %s", session_id)
+                    else:
+                        logger.info(
+                            "Streaming RAG chain for session %s", session_id)
+                        # --- Stream RAG chain output token-by-token ---
+                        # Coalesce chunks so the placeholder re-renders a bounded
+                        # number of times regardless of token rate.
+                        answer_parts = []
+                        pending = 0
+                        last_flush = time.monotonic()
+                        for chunk in rag_chain.stream({
                             "input": prompt,
                             "chat_history": chat_history
-                        })
-                        answer = response.get(
-                            'answer', "Sorry, I couldn't extract an answer.")
-                        # --- --- --- --- --- --- --- ---
-
+                        }):
+                            piece = chunk.get("answer", "")
+                            if not piece:
+                                continue
+                            answer_parts.append(piece)
+                            pending += 1
+                            now = time.monotonic()
+                            if pending >= STREAM_FLUSH_CHUNKS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+                                # Plain text while streaming; markdown is parsed
+                                # only once, on the completed answer below.
+                                message_placeholder.text("".join(answer_parts))
+                                pending = 0
+                                last_flush = now
+                        answer = "".join(answer_parts) or \
+                            "Sorry, I couldn't extract an answer."
                         logger.info(
-                            f"RAG chain invocation successful for session {session_id}")
-                        # Log interaction to DB
-                        insert_application_logs(
-                            session_id, prompt, answer, selected_model)
+                            "RAG chain streaming successful for session %s", session_id)
+                        if query_vec is not None and answer_parts:
+                            semantic_cache.add(selected_model, query_vec, answer)
+                    # --- --- --- --- --- --- --- ---
 
-                        # Update session state and display answer
-                        st.session_state.messages.append(
-                            {"role": "assistant", "content": answer})
-                        message_placeholder.markdown(
-                            answer)  # Update placeholder
+                    # Log interaction to DB
+                    insert_application_logs(
+                        session_id, prompt, answer, selected_model)
+                    st.session_state.history_buf.extend([
+                        {"role": "user", "content": prompt},
+                        {"role": "assistant", "content": answer}])
 
-                        # Optional: Details expander
-                        # with st.expander("Response Details"): st.json(response)
+                    # Update session state and render final formatted answer
+                    st.session_state.messages.append(
+                        {"role": "assistant", "content": answer})
+                    message_placeholder.empty()
+                    message_placeholder.markdown(answer)
 
-                    else:
-                        # Error handled by get_cached_rag_chain via st.error
-                        logger.error("RAG chain is None, cannot process chat.")
-                        message_placeholder.error(
-                            "The RAG chat chain failed to initialize. Please check the logs or API keys.")
-
-                except RAGChainInitializationError as init_err:
-                    logger.error(
-                        f"RAG Chain Init Error during chat: {init_err}")
-                    message_placeholder.error(
-                        f"Could not initialize the chat service: {init_err}")
-                except Exception as e:
-                    logger.error(
-                        f"Error during chat processing or RAG chain invocation: {e}", exc_info=True)
-                    # Consider using CustomException if more detail is needed
+                else:
+                    # Error handled by get_cached_rag_chain via st.error
+                    logger.error("RAG chain is None, cannot process chat.")
                     message_placeholder.error(
-                        f"An unexpected error occurred: {e}")
+                        "The RAG chat chain failed to initialize. Please check the logs or API keys.")
+
+            except RAGChainInitializationError as init_err:
+                logger.error(
+                    "RAG Chain Init Error during chat: %s", init_err)
+                message_placeholder.error(
+                    f"Could not initialize the chat service: {init_err}")
+            except Exception as e:
+                logger.error(
+                    "Error during chat processing or RAG chain streaming: %s", e, exc_info=True)
+                # Consider using CustomException if more detail is needed
+                message_placeholder.error(
+                    f"An unexpected error occurred: {e}")
@@ -3,15 +3,115 @@
 import streamlit as st
 import os
 import tempfile  # Use tempfile for uploads
-import shutil
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 # --- Use ABSOLUTE imports for backend logic ---
-from utils.chroma_utils import index_document_to_chroma, delete_doc_from_chroma
-from utils.db_utils import insert_document_record, delete_document_record, get_all_documents
+from utils.chroma_utils import (index_document_to_chroma, delete_doc_from_chroma, is_vectorstore_ready,
+                                DocumentIndexingError)
+from utils.db_utils import (insert_document_record, delete_document_record, document_record_exists,
+                            get_all_documents)
+from utils.semantic_cache import get_semantic_cache
 from pipeline.logger import logger
 # --- --- --- --- --- --- --- --- --- --- ---
 
+# Widget options, built once at import instead of on every rerun
+MODEL_OPTIONS = ("llama-3.1-8b-instant", "llama-3.3-70b-versatile")
+UPLOAD_FILE_TYPES = ("pdf", "docx", "html")
+# Seconds between polls of background indexing jobs (only while jobs are pending)
+INDEX_POLL_INTERVAL = 2
+
+
+@functools.lru_cache(maxsize=8)
+def _doc_options(doc_signature: tuple) -> dict:
+    """Maps selectbox labels to file IDs; rebuilt only when the document list changes."""
+    return {f"{filename} (ID: {file_id})": file_id for file_id, filename in doc_signature}
+
+
+# --- Background Indexing ---
+
+
+@st.cache_resource
+def _indexer_pool() -> ThreadPoolExecutor:
+    """Process-wide worker pool for document indexing (survives reruns)."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="indexer")
+
+
+def _index_uploaded_file(file_bytes: bytes, filename: str, file_id: int, nomic_api_key: str) -> None:
+    """
+    Runs on an indexer thread: saves the upload to a temp dir and indexes it.
+    Rollback and cache invalidation happen here, so they still run if the
+    submitting session is gone. Errors propagate through the future.
+    """
+    try:
+        # TemporaryDirectory removes the saved file on exit
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Single write from the upload buffer
+            temp_file_path = os.path.join(temp_dir, os.path.basename(filename))
+            Path(temp_file_path).write_bytes(file_bytes)
+            logger.info("File '%s' saved temporarily to %s",
+                        filename, temp_file_path)
+            index_document_to_chroma(temp_file_path, file_id, nomic_api_key)
+    except Exception:
+        # Vectors are already dropped by index_document_to_chroma; roll back
+        # the DB entry too so the filename can be uploaded again
+        logger.warning("Indexing of '%s' failed; rolling back DB entry.", filename)
+        delete_document_record(file_id)  # db_utils function logs errors
+        raise
+    # The record may have been deleted (e.g. from another session) while the
+    # file was indexing; its vectors would then be unreachable, so drop them.
+    if not document_record_exists(file_id):
+        logger.warning(
+            "Document ID %s was deleted during indexing; removing its vectors.", file_id)
+        delete_doc_from_chroma(file_id)
+    # Cached answers may be stale now that the corpus changed
+    get_semantic_cache().clear()
+
+
+def _reap_index_jobs() -> bool:
+    """
+    Queues notices for finished background indexing jobs (the worker already
+    rolled back failed ones). Returns True if any job finished.
+    """
+    jobs = st.session_state.index_jobs
+    finished = False
+    for job in list(jobs):
+        future, filename, file_id = job
+        if not future.done():
+            continue
+        jobs.remove(job)
+        finished = True
+        try:
+            future.result()
+        except DocumentIndexingError as e:
+            logger.error("Background indexing of '%s' failed: %s", filename, e)
+            st.session_state.index_notices.append(
+                f"Indexing '{filename}' failed: {e}. DB entry rolled back.")
+        except Exception as e:
+            logger.error(
+                "Background indexing of '%s' raised: %s", filename, e, exc_info=True)
+            st.session_state.index_notices.append(
+                f"Indexing '{filename}' failed: {e}. DB entry rolled back.")
+        else:
+            st.session_state.index_notices.append(
+                f"File '{filename}' indexed successfully (ID: {file_id}).")
+    return finished
+
+
+def _index_jobs_panel():
+    """Shows pending indexing jobs; reruns the whole app once any of them finishes."""
+    if _reap_index_jobs():
+        st.rerun()  # Refresh the document list and show the notices
+    for _, filename, file_id in st.session_state.index_jobs:
+        st.info(f"Indexing '{filename}' (ID: {file_id}) in the background...")
+
 
 def display_sidebar():
+    if "index_jobs" not in st.session_state:
+        st.session_state.index_jobs = []
+    if "index_notices" not in st.session_state:
+        st.session_state.index_notices = []
+
     st.sidebar.header("API Keys")
     st.sidebar.caption("Needed for Embeddings (Nomic) and Chat (Groq)")
 
@@ -38,21 +138,23 @@ def display_sidebar():
     # Update session state when input changes
     st.session_state.nomic_api_key = nomic_key_input
     st.session_state.groq_api_key = groq_key_input
+    # Read key state once per rerun; session_state is a proxy, not a plain dict
+    nomic_api_key = nomic_key_input
+    n_ok, g_ok = bool(nomic_key_input), bool(groq_key_input)
 
     # Display warning if keys are missing
-    if not st.session_state.nomic_api_key:
+    if not n_ok:
         st.sidebar.warning(
             "Nomic API Key is required for document uploads and chat.")
-    if not st.session_state.groq_api_key:
+    if not g_ok:
         st.sidebar.warning("Groq API Key is required for chat.")
 
     st.sidebar.divider()
 
     st.sidebar.header("Configuration")
     # Model selection
-    model_options = ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"]
     selected_model = st.sidebar.selectbox("Select Chat Model",
-                                          options=model_options,
+                                          options=MODEL_OPTIONS,
                                           key="model_selection")
     # Store selected model in session state
     st.session_state.model = selected_model
@@ -62,115 +164,100 @@ def display_sidebar():
     # Document upload
     st.sidebar.header("Document Management")
     uploaded_file = st.sidebar.file_uploader(
-        "Upload a document", type=["pdf", "docx", "html"])
+        "Upload a document", type=UPLOAD_FILE_TYPES)
 
     if uploaded_file is not None and st.sidebar.button("Upload Document", key="upload_button"):
-        if not st.session_state.nomic_api_key:
+        if not n_ok:
             st.sidebar.error(
                 "Please enter the Nomic API Key before uploading.")
+        # Warm the cached embedding/vector store on this (script) thread so the
+        # background job only hits caches and init errors surface in the UI now
+        elif not is_vectorstore_ready(nomic_api_key):
+            st.sidebar.error(
+                "Vector store is not available. Check the Nomic API Key and logs.")
         else:
-            with st.spinner("Processing and indexing document..."):
-                # 1. Save to temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                    shutil.copyfileobj(uploaded_file, tmp_file)
-                    temp_file_path = tmp_file.name
+            file_id = None
+            try:
+                # 1. Insert DB record
+                file_id = insert_document_record(uploaded_file.name)
+                if file_id:
+                    # 2. Index in the background; the jobs panel polls for the result
+                    future = _indexer_pool().submit(
+                        _index_uploaded_file,
+                        uploaded_file.getvalue(),
+                        uploaded_file.name,
+                        file_id,
+                        nomic_api_key
+                    )
+                    st.session_state.index_jobs.append(
+                        (future, uploaded_file.name, file_id))
                     logger.info(
-                        f"File '{uploaded_file.name}' saved temporarily to {temp_file_path}")
-
-                file_id = None
-                indexing_success = False
-                try:
-                    # 2. Insert DB record
-                    file_id = insert_document_record(uploaded_file.name)
-                    if file_id:
-                        # 3. Index document (pass API key from session state)
-                        indexing_success = index_document_to_chroma(
-                            temp_file_path,
-                            file_id,
-                            st.session_state.nomic_api_key
-                        )
-                    else:
-                        st.sidebar.error(
-                            "Failed to get File ID from database.")
-
-                except ValueError as ve:  # Handle duplicate filename error from db_utils
-                    st.sidebar.error(f"Upload failed: {ve}")
-                except Exception as e:
-                    logger.error(
-                        f"Error during upload/indexing process: {e}", exc_info=True)
-                    st.sidebar.error(
-                        f"An unexpected error occurred during upload: {e}")
-                finally:
-                    # 4. Clean up temporary file
-                    if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
-                        logger.info(
-                            f"Removed temporary file: {temp_file_path}")
-
-                # 5. Handle results
-                if file_id and indexing_success:
-                    st.sidebar.success(
-                        f"File '{uploaded_file.name}' indexed successfully (ID: {file_id}).")
-                    # Optionally clear file uploader state here if needed (can be tricky)
-                elif file_id and not indexing_success:
+                        "Submitted background indexing for '%s' (ID: %s)", uploaded_file.name, file_id)
+                else:
                     st.sidebar.error(
-                        f"File '{uploaded_file.name}' uploaded but indexing failed. Rolling back DB entry.")
-                    # Attempt rollback (db_utils function logs errors)
-                    delete_document_record(file_id)
-                # else: error already shown or handled
+                        "Failed to get File ID from database.")
+
+            except ValueError as ve:  # Handle duplicate filename error from db_utils
+                st.sidebar.error(f"Upload failed: {ve}")
+            except Exception as e:
+                logger.error(
+                    "Error during upload/indexing process: %s", e, exc_info=True)
+                st.sidebar.error(
+                    f"An unexpected error occurred during upload: {e}")
 
-        # Refresh documents list after any upload attempt
-        with st.spinner("Refreshing document list..."):
-            st.session_state.documents = get_all_documents()
+    # Show documents still being indexed; the fragment polls only while jobs are pending
+    with st.sidebar:
+        st.fragment(_index_jobs_panel,
+                    run_every=INDEX_POLL_INTERVAL if st.session_state.index_jobs else None)()
+    for notice in st.session_state.index_notices:
+        st.toast(notice)
+    st.session_state.index_notices.clear()
 
     st.sidebar.divider()
 
     # List and delete documents
     st.sidebar.subheader("Indexed Documents")
     if st.sidebar.button("Refresh Document List", key="refresh_docs_button"):
-        with st.spinner("Refreshing document list..."):
-            st.session_state.documents = get_all_documents()
+        get_all_documents.clear()
 
-    # Initialize documents if not present
-    if "documents" not in st.session_state:
-        st.session_state.documents = get_all_documents()  # Load initially
+    # Served from cache on reruns; db_utils clears it on insert/delete (or TTL expiry)
+    st.session_state.documents = get_all_documents()
 
     if st.session_state.documents is None:  # Check if loading failed
         st.sidebar.warning("Could not retrieve document list from database.")
         st.session_state.documents = []  # Set to empty list to avoid errors
 
     if st.session_state.documents:
-        doc_options = {f"{doc['filename']} (ID: {doc['id']})": doc['id']
-                       for doc in st.session_state.documents}
+        # Files still indexing can't be deleted: the job would re-add their vectors
+        pending_ids = {file_id for _, _, file_id in st.session_state.index_jobs}
+        doc_options = _doc_options(
+            tuple((doc['id'], doc['filename']) for doc in st.session_state.documents
+                  if doc['id'] not in pending_ids))
         if doc_options:
-            selected_doc_label = st.sidebar.selectbox("Select document to delete", options=list(
-                doc_options.keys()), key="delete_doc_select")
+            selected_doc_label = st.sidebar.selectbox(
+                "Select document to delete", options=tuple(doc_options), key="delete_doc_select")
             selected_file_id = doc_options[selected_doc_label]
 
             if st.sidebar.button("Delete Selected Document", key="delete_doc_button"):
-                if not st.session_state.nomic_api_key:
-                    st.sidebar.error("Nomic API Key needed for deletion.")
-                else:
-                    with st.spinner(f"Deleting document ID {selected_file_id}..."):
-                        # Call deletion functions directly
-                        chroma_deleted = delete_doc_from_chroma(
-                            selected_file_id, st.session_state.nomic_api_key)
-                        db_deleted = False
-                        if chroma_deleted:  # Only delete from DB if Chroma delete seemed successful
-                            db_deleted = delete_document_record(
-                                selected_file_id)
-                            if db_deleted:
-                                st.sidebar.success(
-                                    f"Document ID {selected_file_id} deleted successfully.")
-                            else:
-                                st.sidebar.error(
-                                    f"Deleted from vector store, but failed to delete DB record for ID {selected_file_id}.")
+                # Deletion filters by metadata only, so no Nomic API key is needed
+                with st.spinner(f"Deleting document ID {selected_file_id}..."):
+                    # Call deletion functions directly
+                    chroma_deleted = delete_doc_from_chroma(
+                        selected_file_id)
+                    db_deleted = False
+                    if chroma_deleted:  # Only delete from DB if Chroma delete seemed successful
+                        db_deleted = delete_document_record(
+                            selected_file_id)
+                        if db_deleted:
+                            get_semantic_cache().clear()
+                            st.sidebar.success(
+                                f"Document ID {selected_file_id} deleted successfully.")
                         else:
                             st.sidebar.error(
-                                f"Failed to delete document ID {selected_file_id} from vector store.")
-
-                    # Refresh list after delete attempt
-                    st.session_state.documents = get_all_documents()
+                                f"Deleted from vector store, but failed to delete DB record for ID {selected_file_id}.")
+                    else:
+                        st.sidebar.error(
+                            f"Failed to delete document ID {selected_file_id} from vector store.")
         else:
             st.sidebar.write("No documents available for deletion.")
     else:
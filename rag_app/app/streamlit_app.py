@@ -1,31 +1,46 @@
 # rag_app/app/streamlit_app.py
 
-# --- SQLite Patch for ChromaDB ---
-# This MUST be run before chromadb is imported.
-try:
-    __import__('pysqlite3')
-    import sys
-    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-    print("[SQLite Patch] Successfully patched sqlite3 with pysqlite3.")
-except ImportError:
-    print("[SQLite Patch] pysqlite3-binary not found, defaulting to system sqlite3. ChromaDB might fail.")
-except Exception as e:
-    print(f"[SQLite Patch] Error patching sqlite3: {e}")
-# --- End SQLite Patch ---
-
-import streamlit as st
 import sys
 import os
-import uuid
 
-# --- Path Modification Workaround (if needed, test without first) ---
-script_dir = os.path.dirname(os.path.abspath(__file__))
-rag_app_dir = os.path.dirname(script_dir)
-if rag_app_dir not in sys.path:
-    print(
-        f"[streamlit_app.py] Adding rag_app directory to sys.path: {rag_app_dir}")
-    sys.path.insert(0, rag_app_dir)
-# --- End Path Modification ---
+
+def _bootstrap():
+    """
+    One-shot process setup: SQLite patch for ChromaDB and rag_app on sys.path.
+    Streamlit re-executes this script on every rerun (so a function-level cache
+    defined here would be recreated each time); a flag on `sys` survives reruns.
+    """
+    if getattr(sys, "_ragapp_bootstrapped", False):
+        return
+
+    # --- SQLite Patch for ChromaDB ---
+    # This MUST be run before chromadb is imported.
+    try:
+        __import__('pysqlite3')
+        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+        print("[SQLite Patch] Successfully patched sqlite3 with pysqlite3.")
+    except ImportError:
+        print("[SQLite Patch] pysqlite3-binary not found, defaulting to system sqlite3. ChromaDB might fail.")
+    except Exception as e:
+        print(f"[SQLite Patch] Error patching sqlite3: {e}")
+    # --- End SQLite Patch ---
+
+    # --- Path Modification Workaround (if needed, test without first) ---
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    rag_app_dir = os.path.dirname(script_dir)
+    if rag_app_dir not in sys.path:
+        print(
+            f"[streamlit_app.py] Adding rag_app directory to sys.path: {rag_app_dir}")
+        sys.path.insert(0, rag_app_dir)
+    # --- End Path Modification ---
+
+    sys._ragapp_bootstrapped = True
+
+
+_bootstrap()
+
+import streamlit as st
+import uuid
 
 # --- Import core components ---
 try:
@@ -33,7 +48,6 @@ try:
     from app.chat_interface import display_chat_interface
     from utils.db_utils import ensure_db_initialized  # Import DB initializer
     from pipeline.logger import logger  # Import logger
-    print("[streamlit_app.py] Successfully imported components.")
 except ImportError as e:
     # This error should ideally not happen if running 'streamlit run rag_app/app/streamlit_app.py' from root
     print(
@@ -44,9 +58,7 @@ except ImportError as e:
 
 # --- Initialize Database ---
 try:
-    logger.info("streamlit_app.py: Ensuring database is initialized...")
-    ensure_db_initialized()  # Call the DB init function once
-    logger.info("streamlit_app.py: Database initialization check complete.")
+    ensure_db_initialized()  # Cached in db_utils: no-op after the first successful run
 except Exception as e:
     logger.critical(
         f"streamlit_app.py: Database initialization failed: {e}", exc_info=True)
@@ -63,14 +75,14 @@ if "messages" not in st.session_state:
     st.session_state.messages = [
         {"role": "assistant", "content": "Hello! Please enter API Keys in the sidebar."}]
 if "session_id" not in st.session_state:
-    # Need uuid imported if generating here
-    st.session_state.session_id = str(uuid.uuid4())
+    # Only generated inside the guard; .hex skips the dashed str() formatting
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Display components (assuming imports succeeded)
 display_sidebar()
 display_chat_interface()
 
-logger.info("Streamlit app execution finished.")
+logger.debug("Streamlit app execution finished.")
 # === END Streamlit App Logic ===
 
 # No main() function needed.
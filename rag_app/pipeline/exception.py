@@ -5,7 +5,9 @@ import sys
 
 class CustomException(Exception):
     def __init__(self, error_message, error_details: sys = sys):  # Default sys
-        exc_type, exc_value, exc_tb = error_details.exc_info()
+        # Only the line number and file name are kept; holding the traceback
+        # itself would keep every frame (and its locals) alive.
+        exc_tb = error_details.exc_info()[2]
         if exc_tb is not None:
             self.lineno = exc_tb.tb_lineno
             self.file_name = exc_tb.tb_frame.f_code.co_filename
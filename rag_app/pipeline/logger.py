@@ -1,34 +1,58 @@
 # rag_app/pipeline/logger.py
 # (Keep the last version that logs relative to os.getcwd() and includes console handler)
+import atexit
 import logging
+import logging.handlers
 import os
 import sys
 from datetime import datetime
 
-LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-log_path = os.path.join(os.getcwd(), "logs")
-print(f"[Logger Setup] Attempting to create/use log directory: {log_path}")
-
-try:
-    os.makedirs(log_path, exist_ok=True)
-    LOG_FILEPATH = os.path.join(log_path, LOG_FILE)
-    print(f"[Logger Setup] Log file path set to: {LOG_FILEPATH}")
-
-    logging.basicConfig(level=logging.INFO,
-                        filename=LOG_FILEPATH,
-                        format="[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-                        )
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        "[%(asctime)s] %(name)s - %(levelname)s - %(message)s")
-    console_handler.setFormatter(formatter)
-    root_logger = logging.getLogger()
-    if not any(isinstance(h, logging.StreamHandler) for h in root_logger.handlers):
-        root_logger.addHandler(console_handler)
-except Exception as e:
-    print(
-        f"[CRITICAL Logger Setup Error] Failed to configure logging: {e}", file=sys.stderr)
+# File output is buffered and only records WARNING+, so INFO logging on the
+# chat hot path does not cost a write() per record. Console stays at INFO.
+LOG_FILE_LEVEL = logging.WARNING
+LOG_FILE_MAX_BYTES = 5_000_000
+LOG_FILE_BACKUP_COUNT = 3
+LOG_BUFFER_CAPACITY = 64
+
+# Setup runs once per process: module reloads (e.g. Streamlit hot reload) must
+# not recompute the log filename, re-stat the directory or stack handlers.
+if not getattr(logging, "_ragapp_configured", False):
+    LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
+    log_path = os.path.join(os.getcwd(), "logs")
+    print(f"[Logger Setup] Attempting to create/use log directory: {log_path}")
+
+    try:
+        os.makedirs(log_path, exist_ok=True)
+        LOG_FILEPATH = os.path.join(log_path, LOG_FILE)
+        print(f"[Logger Setup] Log file path set to: {LOG_FILEPATH}")
+
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.INFO)
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILEPATH, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT)
+        file_handler.setLevel(LOG_FILE_LEVEL)
+        file_handler.setFormatter(logging.Formatter(
+            "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s"))
+        # Flushes to the file every LOG_BUFFER_CAPACITY records, or immediately on ERROR+
+        memory_handler = logging.handlers.MemoryHandler(
+            capacity=LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler)
+        memory_handler.setLevel(LOG_FILE_LEVEL)
+        root_logger.addHandler(memory_handler)
+        atexit.register(memory_handler.flush)
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(logging.INFO)
+        formatter = logging.Formatter(
+            "[%(asctime)s] %(name)s - %(levelname)s - %(message)s")
+        console_handler.setFormatter(formatter)
+        if not any(type(h) is logging.StreamHandler for h in root_logger.handlers):
+            root_logger.addHandler(console_handler)
+        logging._ragapp_configured = True  # Only marked once setup succeeded
+    except Exception as e:
+        print(
+            f"[CRITICAL Logger Setup Error] Failed to configure logging: {e}", file=sys.stderr)
+
 
 logger = logging.getLogger("RAGAppLogger")
 if not logger.hasHandlers() and not logging.getLogger().hasHandlers():
@@ -1,28 +1,44 @@
 # rag_app/utils/chroma_utils.py
 
 import streamlit as st
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 # --- EMBEDDING IMPORT ---
 # Import typing tools needed for hints
-from typing import Optional, List, Type
+from typing import Optional, List, Tuple, TYPE_CHECKING
 
-try:
-    # Import the actual class
+# NomicEmbeddings (and the document loaders) are imported lazily where they
+# are used, keeping their import trees off the Streamlit cold-start path.
+if TYPE_CHECKING:
     from langchain_nomic import NomicEmbeddings
-    # Define the type alias pointing to the real class
-    NomicEmbeddingsType = NomicEmbeddings  # Store the type if import succeeds
-    print("[Chroma Utils] Using NomicEmbeddings from langchain_nomic package.")
+# --- --- --- --- --- --- --- ---
+# --- PDF BACKEND IMPORT ---
+try:
+    # C-backed PDFium text extraction, much faster than pure-Python pypdf.
+    # PDFium is not thread-safe: all calls go through _PDFIUM_LOCK (see _load_pdf).
+    import pypdfium2 as pdfium
+    print("[Chroma Utils] Using pypdfium2 for PDF text extraction.")
+except ImportError:
+    print("[Chroma Utils] pypdfium2 not found, falling back to PyPDFLoader.")
+    pdfium = None
+# --- --- --- --- --- --- --- ---
+# --- TEXT SPLITTER IMPORT ---
+try:
+    # Rust-backed splitter: runs the recursive split in compiled code
+    from semantic_text_splitter import TextSplitter as NativeTextSplitter
+    print("[Chroma Utils] Using semantic-text-splitter for document chunking.")
 except ImportError:
-    print("[Chroma Utils] ERROR: langchain_nomic package not found. Please install it (`pip install langchain-nomic`).")
-    # Define NomicEmbeddingsType as None *only* if import fails
-    # This variable itself isn't used in hints anymore, but helps logic later
-    NomicEmbeddingsType = None
+    print("[Chroma Utils] semantic-text-splitter not found, falling back to RecursiveCharacterTextSplitter.")
+    NativeTextSplitter = None
 # --- --- --- --- --- --- --- ---
 from langchain_chroma import Chroma
+import chromadb
 from langchain_core.documents import Document
 import os
 import sys
+import hashlib
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, Future
 from dotenv import load_dotenv, find_dotenv
 from pipeline.exception import CustomException
 from pipeline.logger import logger
@@ -34,23 +50,57 @@ from pipeline.logger import logger
 
 # --- Define Nomic Configuration ---
 NOMIC_MODEL_NAME = os.getenv("NOMIC_MODEL_NAME", "nomic-embed-text-v1.5")
+# Matryoshka truncation (e.g. 256 of v1.5's 768 dims) is the lever for vector
+# memory: Chroma's HNSW index keeps float32 vectors whatever dtype is passed in.
+# Changing it requires re-indexing into a fresh collection.
 nomic_dimensionality_str = os.getenv("NOMIC_DIMENSIONALITY")
 NOMIC_DIMENSIONALITY = int(
     nomic_dimensionality_str) if nomic_dimensionality_str else None
 # --- --- --- --- --- --- --- --- ---
 
+# --- Chroma Configuration ---
+CHROMA_PERSIST_DIR = os.path.join(os.getcwd(), 'data', 'chroma_db')
+# LangChain's Chroma wrapper uses this collection name by default
+CHROMA_COLLECTION_NAME = "langchain"
+# HNSW index settings tuned for bulk insert throughput. Chroma only applies
+# these when the collection is first created.
+CHROMA_COLLECTION_METADATA = {
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:batch_size": 1000,
+}
+# --- --- --- --- --- --- --- --- ---
+
+
+class DocumentIndexingError(Exception):
+    """Raised when a document cannot be indexed; the message is meant for the UI."""
+    pass
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Stable, non-secret cache key for an API key (the raw key never enters Streamlit's cache)."""
+    return hashlib.sha1(api_key.encode()).hexdigest() if api_key else ""
+
 # --- Cached Resource: Embedding Function ---
 
 
+def get_embedding_function(nomic_api_key: str, model: str, dimensionality: Optional[int]) -> Optional['NomicEmbeddings']:
+    """Returns the cached Nomic Embeddings object for this key/model/dimensionality."""
+    return _get_embedding_function(api_key_fingerprint(nomic_api_key), model, dimensionality, nomic_api_key)
+
+
 @st.cache_resource(show_spinner="Initializing embedding model...")
 # --- CORRECTED TYPE HINT USING STRING FORWARD REFERENCE ---
 # Use string
-def get_embedding_function(nomic_api_key: str, model: str, dimensionality: Optional[int]) -> Optional['NomicEmbeddings']:
+def _get_embedding_function(nomic_key_hash: str, model: str, dimensionality: Optional[int], _nomic_api_key: str) -> Optional['NomicEmbeddings']:
     # --- END CORRECTION ---
-    """Initializes and returns the Nomic Embeddings object."""
-    if NomicEmbeddingsType is None:  # Check if the import failed using the variable
+    """Initializes and returns the Nomic Embeddings object. Cached on the key hash; `_nomic_api_key` is not hashed."""
+    nomic_api_key = _nomic_api_key
+    try:
+        from langchain_nomic import NomicEmbeddings
+    except ImportError:
         logger.error(
-            "Cannot get embedding function: NomicEmbeddings class not imported.")
+            "Cannot get embedding function: langchain_nomic package not found. Please install it (`pip install langchain-nomic`).")
         st.error(
             "Nomic Embeddings library not found. Please install langchain-nomic.")
         return None
@@ -62,11 +112,12 @@ def get_embedding_function(nomic_api_key: str, model: str, dimensionality: Optio
     logger.info(
         f"Cache miss or arguments changed. Initializing NomicEmbeddings (Model: {model}, Dim: {dimensionality or 'Default'})...")
     try:
-        os.environ["NOMIC_API_KEY"] = nomic_api_key
-        # Use the original class name now, guarded by the check above
+        # Key is passed explicitly rather than via process-global os.environ,
+        # which would race between sessions initializing concurrently.
         embeddings = NomicEmbeddings(
             model=model,
-            dimensionality=dimensionality
+            dimensionality=dimensionality,
+            nomic_api_key=nomic_api_key
         )
         logger.info("NomicEmbeddings initialized successfully.")
         return embeddings
@@ -81,31 +132,45 @@ def get_embedding_function(nomic_api_key: str, model: str, dimensionality: Optio
         st.error(f"Nomic Embeddings Initialization Error: {emb_e}")
         return None
 
+# --- Cached Resource: Native Chroma Client / Collection ---
+
+
+@st.cache_resource(show_spinner=False)
+def _get_chroma_raw_client():
+    """Native Chroma client on the persist directory; needs no embedding function."""
+    logger.info(f"Using persist directory: {CHROMA_PERSIST_DIR}")
+    os.makedirs(CHROMA_PERSIST_DIR, exist_ok=True)
+    return chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def get_raw_collection():
+    """
+    The native collection behind the LangChain wrapper. Indexing (with
+    precomputed embeddings) and deletion use it directly, bypassing the wrapper.
+    """
+    return _get_chroma_raw_client().get_or_create_collection(
+        name=CHROMA_COLLECTION_NAME,
+        embedding_function=None,
+        metadata=CHROMA_COLLECTION_METADATA)
+
 # --- Cached Resource: Vector Store ---
 
 
-@st.cache_resource(show_spinner="Connecting to vector store...")
-def get_vector_store(_embedding_function: Optional['NomicEmbeddings']) -> Optional[Chroma]:
-    if _embedding_function is None:
+def get_vector_store(nomic_api_key: str) -> Optional[Chroma]:
+    """
+    Returns the cached LangChain Chroma wrapper bound to this key's embedding function.
+    Failures are reported and return None without being cached, so a corrected key can retry.
+    """
+    emb_func = get_embedding_function(
+        nomic_api_key, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY)
+    if emb_func is None:
         logger.error(
             "Cannot initialize vector store: Embedding function is None.")
         return None
-    logger.info("Attempting Chroma initialization...")
     try:
-        persist_directory = os.path.join(os.getcwd(), 'data', 'chroma_db')
-        logger.info(f"Using persist directory: {persist_directory}")
-        if not os.path.exists(persist_directory):
-            os.makedirs(persist_directory)
-            logger.info("Created persist directory.")
-
-        logger.info("Calling Chroma constructor...")
-        vs = Chroma(persist_directory=persist_directory,
-                    embedding_function=_embedding_function)
-        logger.info("Chroma constructor finished.")
-        # Test if collection exists (might indicate success)
-        logger.info(
-            f"Chroma collection name: {vs._collection.name if hasattr(vs, '_collection') else 'N/A'}")
-        return vs
+        return _get_vector_store(api_key_fingerprint(nomic_api_key), NOMIC_MODEL_NAME,
+                                 NOMIC_DIMENSIONALITY, emb_func)
     except Exception as chroma_e:
         # Log error details
         logger.error(
@@ -113,137 +178,318 @@ def get_vector_store(_embedding_function: Optional['NomicEmbeddings']) -> Option
         st.error(f"Failed to initialize Vector Store: {chroma_e}")
         return None
 
+
+@st.cache_resource(show_spinner="Connecting to vector store...")
+def _get_vector_store(nomic_key_hash: str, model: str, dimensionality: Optional[int], _embedding_function: 'NomicEmbeddings') -> Chroma:
+    """Builds the wrapper once per key/model/dimensionality. Raises on failure so errors are not cached."""
+    logger.info("Attempting Chroma initialization...")
+    logger.info("Calling Chroma constructor...")
+    # Share the native client so the wrapper and raw paths see one collection
+    vs = Chroma(client=_get_chroma_raw_client(),
+                collection_name=CHROMA_COLLECTION_NAME,
+                collection_metadata=CHROMA_COLLECTION_METADATA,
+                embedding_function=_embedding_function)
+    logger.info("Chroma constructor finished.")
+    # Same collection the raw write/delete paths use (resolved and cached once)
+    logger.info(f"Chroma collection name: {get_raw_collection().name}")
+    return vs
+
 # --- Readiness Check Function ---
 
 
 def is_vectorstore_ready(nomic_api_key: str) -> bool:
     """Checks if the vectorstore can be initialized successfully."""
-    emb_func = get_embedding_function(
-        nomic_api_key, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY)
-    vs = get_vector_store(emb_func)
-    is_ready_now = emb_func is not None and vs is not None
-    logger.debug(
-        f"Readiness check result: {is_ready_now} (Embedding: {'OK' if emb_func else 'Failed'}, Vectorstore: {'OK' if vs else 'Failed'})")
+    is_ready_now = get_vector_store(nomic_api_key) is not None
+    logger.debug(f"Readiness check result: {is_ready_now}")
     return is_ready_now
 
 
 # --- Document Processing Functions ---
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000, chunk_overlap=200, length_function=len)
+# Chunks sent to the Nomic API per embed_documents() request (and per Chroma write)
+EMBED_BATCH_SIZE = int(os.getenv("NOMIC_EMBED_BATCH", "512"))
+# Embedding requests in flight at once; batches beyond this wait for a write
+EMBED_CONCURRENCY = int(os.getenv("NOMIC_EMBED_CONCURRENCY", "4"))
+EMBED_MAX_IN_FLIGHT = 2 * EMBED_CONCURRENCY
+# Embedding is pure network I/O, so threads overlap it with Chroma writes
+_EMBED_POOL = ThreadPoolExecutor(
+    max_workers=EMBED_CONCURRENCY, thread_name_prefix="nomic-embed")
+# Serializes writes to the shared collection (several indexing jobs may run)
+_CHROMA_WRITE_LOCK = threading.Lock()
+
+# Character-based chunking (length_function=len), so the native splitter
+# applies without any Python tokenizer callback
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Per-page loader metadata that no longer applies once chunks span pages
+PAGE_METADATA_KEYS = ("page", "page_label")
+
+
+# --- Cached Resource: Text Splitter ---
+
+
+@st.cache_resource(show_spinner=False)
+def _get_text_splitter():
+    """Builds the text splitter once per process instead of on every module reload."""
+    if NativeTextSplitter is not None:
+        return NativeTextSplitter(CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len,
+        is_separator_regex=False, add_start_index=True)
+
+
+# Post-split merge: adjacent chunks are combined up to MERGE_MAX_CHUNK chars,
+# and chunks under MERGE_MIN_CHUNK chars are always folded into the previous one
+MERGE_MIN_CHUNK = 100
+MERGE_MAX_CHUNK = 1150
 
-# (Keep load_and_split_document, index_document_to_chroma, delete_doc_from_chroma
-# exactly as they were in the previous version - they correctly call the getter functions)
+
+def _merge_small_chunks(raw_text: str, spans: List[Tuple[int, str]], min_size: int = MERGE_MIN_CHUNK, max_size: int = MERGE_MAX_CHUNK) -> List[str]:
+    """
+    Greedily merges adjacent (start offset, chunk) spans of raw_text to cut the number of embeddings.
+    Merged chunks are sliced from raw_text, so the overlap between neighbours is not repeated.
+    Folding a chunk under min_size can exceed max_size, by design, but by less than min_size.
+    """
+    merged: List[str] = []
+    cur_start = cur_end = None
+    for start, chunk in spans:
+        end = start + len(chunk)
+        if cur_start is not None and (
+                max(cur_end, end) - cur_start <= max_size or len(chunk) < min_size):
+            cur_end = max(cur_end, end)
+            continue
+        if cur_start is not None:
+            merged.append(raw_text[cur_start:cur_end])
+        cur_start, cur_end = start, end
+    if cur_start is not None:
+        merged.append(raw_text[cur_start:cur_end])
+    return merged
+
+
+def _split_documents(documents: List[Document]) -> List[Document]:
+    """
+    Splits a loaded file into chunks in a single pass over its concatenated text,
+    then merges small neighbours. Chunks can span pages, so page-level metadata
+    is dropped from the shared base.
+    """
+    if not documents:
+        return []
+    raw_text = "\n\n".join(doc.page_content for doc in documents)
+    text_splitter = _get_text_splitter()
+    if NativeTextSplitter is not None:
+        spans = text_splitter.chunk_indices(raw_text)
+    else:
+        spans = [(doc.metadata["start_index"], doc.page_content)
+                 for doc in text_splitter.create_documents([raw_text])]
+    base_meta = {key: value for key, value in documents[0].metadata.items()
+                 if key not in PAGE_METADATA_KEYS}
+    return [Document(page_content=chunk, metadata={**base_meta})
+            for chunk in _merge_small_chunks(raw_text, spans)]
+
+
+# PDFium has no internal locking, and PDFs are loaded from the indexer pool
+# and from session threads, so extraction is serialized process-wide
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _load_pdf(file_path: str) -> List[Document]:
+    """Extracts one Document per page with PDFium (same metadata keys as PyPDFLoader)."""
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            documents = []
+            for page_number in range(len(pdf)):
+                page = pdf[page_number]
+                textpage = page.get_textpage()
+                documents.append(Document(page_content=textpage.get_text_range(),
+                                          metadata={'source': file_path, 'page': page_number}))
+                textpage.close()
+                page.close()
+            return documents
+        finally:
+            pdf.close()
+
+
+# Part of the on-disk split cache key: any change to the chunking settings or
+# the available backends invalidates earlier results. Bump the version when
+# the loading/splitting code itself changes.
+SPLIT_PIPELINE_VERSION = 2
+SPLIT_PIPELINE_CONFIG = (SPLIT_PIPELINE_VERSION, CHUNK_SIZE, CHUNK_OVERLAP,
+                         MERGE_MIN_CHUNK, MERGE_MAX_CHUNK,
+                         NativeTextSplitter is not None, pdfium is not None)
+
+
+@st.cache_data(persist="disk", max_entries=200, show_spinner=False)
+def _load_and_split_cached(content_hash: str, ext: str, pipeline_config: tuple, _file_path: str) -> List[Document]:
+    """
+    Loads and splits a file. Cached on disk by content hash and pipeline config,
+    so re-uploads and restarts skip parsing until the chunking setup changes.
+    """
+    if ext not in ('.pdf', '.docx', '.html'):
+        logger.error(f"Unsupported file type: {_file_path}")
+        raise ValueError(f"Unsupported file type: {_file_path}")
+    logger.info(f"Loading document: {_file_path}")
+    # Loaders are imported on first use; UnstructuredHTMLLoader in particular
+    # pulls in unstructured, nltk and lxml
+    if ext == '.pdf' and pdfium is not None:
+        documents = _load_pdf(_file_path)
+    elif ext == '.pdf':
+        from langchain_community.document_loaders import PyPDFLoader
+        documents = PyPDFLoader(_file_path).load()
+    elif ext == '.docx':
+        from langchain_community.document_loaders import Docx2txtLoader
+        documents = Docx2txtLoader(_file_path).load()
+    else:
+        from langchain_community.document_loaders import UnstructuredHTMLLoader
+        documents = UnstructuredHTMLLoader(_file_path).load()
+    logger.info(
+        f"Splitting {len(documents)} pages/sections from: {_file_path}")
+    return _split_documents(documents)
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def load_and_split_document(file_path: str) -> List[Document]:
     try:
         ext = os.path.splitext(file_path)[1].lower()
-        if ext == '.pdf':
-            loader = PyPDFLoader(file_path)
-        elif ext == '.docx':
-            loader = Docx2txtLoader(file_path)
-        elif ext == '.html':
-            loader = UnstructuredHTMLLoader(file_path)
-        else:
-            logger.error(f"Unsupported file type: {file_path}")
-            raise ValueError(f"Unsupported file type: {file_path}")
-        logger.info(f"Loading document: {file_path}")
-        documents = loader.load()
-        logger.info(
-            f"Splitting {len(documents)} pages/sections from: {file_path}")
-        splits = text_splitter.split_documents(documents)
+        # Exceptions are not cached, so a failed parse is retried next time
+        splits = _load_and_split_cached(
+            _file_sha256(file_path), ext, SPLIT_PIPELINE_CONFIG, file_path)
         logger.info(f"Document {file_path} split into {len(splits)} chunks.")
         return splits
     except ValueError as ve:
         logger.error(
             f"Value error during document processing for {file_path}: {ve}")
-        raise ve
+        raise DocumentIndexingError(str(ve)) from ve
     except Exception as e:
         error_details = CustomException(e, sys)
         logger.error(
             f"Failed to load/split document {file_path}: {error_details}", exc_info=True)
-        st.error(
-            f"Failed to process document {os.path.basename(file_path)}: {e}")
-        return []
+        raise DocumentIndexingError(
+            f"Failed to process document {os.path.basename(file_path)}: {e}") from e
+
+
+def _write_batch(collection, file_id_str: str, texts: List[str], metadatas: List[dict], start: int, embeddings_future: Future) -> None:
+    """Waits for one batch's embeddings and adds them to the collection."""
+    batch_embeddings = embeddings_future.result()  # Re-raises embedding errors
+    end = start + len(batch_embeddings)
+    # Precomputed embeddings go straight to the collection, skipping
+    # LangChain's re-batching in Chroma.add_documents
+    with _CHROMA_WRITE_LOCK:
+        # Deterministic "<file_id>:<chunk index>" IDs: re-indexing a file
+        # overwrites its vectors instead of duplicating them
+        collection.upsert(
+            ids=[f"{file_id_str}:{i}" for i in range(start, end)],
+            embeddings=batch_embeddings,
+            documents=texts[start:end],
+            metadatas=metadatas[start:end]
+        )
+    logger.debug(
+        f"Indexed chunks {start}-{end - 1} for file_id {file_id_str}.")
 
 
-def index_document_to_chroma(file_path: str, file_id: int, nomic_api_key: str) -> bool:
-    # 1. GET EMBEDDING FUNCTION / VECTORSTORE (SHOULD BE CACHED & OK NOW)
+def index_document_to_chroma(file_path: str, file_id: int, nomic_api_key: str) -> None:
+    """
+    Embeds a file's chunks into Chroma under its file_id. Raises DocumentIndexingError
+    on failure (also from worker threads, where st.error would not reach the UI).
+    """
+    # 1. GET EMBEDDING FUNCTION / NATIVE COLLECTION (SHOULD BE CACHED & OK NOW)
     emb_func = get_embedding_function(
         nomic_api_key, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY)
-    vs = get_vector_store(emb_func)
-    if not vs:
+    if emb_func is None:
         # Should not happen if init was ok
         logger.error(
-            "Cannot index document: Vectorstore not initialized/retrieved.")
-        return False
-
+            "Cannot index document: Embedding function not initialized/retrieved.")
+        raise DocumentIndexingError(
+            "Embedding function not available. Check the Nomic API key.")
     try:
-        logger.info(
-            f"Starting indexing process for file: {file_path}, file_id: {file_id}")
+        collection = get_raw_collection()
+    except Exception as col_e:
+        logger.error(
+            f"Cannot index document: Chroma collection unavailable: {col_e}", exc_info=True)
+        raise DocumentIndexingError(
+            f"Vector Store not available, cannot index: {col_e}") from col_e
 
-        # 2. LOAD AND SPLIT (POTENTIAL FAILURE POINT A)
-        splits = load_and_split_document(file_path)
-        if not splits:  # Check if load_and_split had an error and returned []
-            logger.error(
-                f"No content generated from splitting {file_path}. Indexing aborted.")
-            return False  # Return False as indexing didn't happen
+    logger.info(
+        f"Starting indexing process for file: {file_path}, file_id: {file_id}")
+
+    # 2. LOAD AND SPLIT (POTENTIAL FAILURE POINT A, raises DocumentIndexingError)
+    splits = load_and_split_document(file_path)
+    if not splits:
+        logger.error(
+            f"No content generated from splitting {file_path}. Indexing aborted.")
+        raise DocumentIndexingError(
+            f"No text could be extracted from {os.path.basename(file_path)}.")
 
-        # 3. PREPARE METADATA (Usually safe)
+    try:
+        # 3. PREPARE TEXTS AND METADATA (column layout expected by collection.add)
         file_id_str = str(file_id)
-        docs_to_add = []
-        for split in splits:
-            split.metadata = split.metadata or {}
-            split.metadata['file_id'] = file_id_str
-            docs_to_add.append(split)
-        if not docs_to_add:
-            logger.warning(
-                f"No document splits generated for file_id {file_id_str}. Nothing to index.")
-            return False
+        texts = [split.page_content for split in splits]
+        metadatas = [{**(split.metadata or {}), 'file_id': file_id_str}
+                     for split in splits]
 
         logger.info(
-            f"Adding {len(docs_to_add)} document chunks with file_id {file_id_str} to Chroma...")
+            f"Adding {len(texts)} document chunks with file_id {file_id_str} to Chroma...")
+        # Drop chunks from any earlier indexing of this file_id (e.g. a longer
+        # previous version) so the result is the same however often it runs
+        with _CHROMA_WRITE_LOCK:
+            collection.delete(where={"file_id": file_id_str})
+
+        # 4. EMBED AND WRITE IN BATCHES (POTENTIAL FAILURE POINT B - API CALL)
+        # Up to EMBED_MAX_IN_FLIGHT batches are embedded on the pool while this
+        # thread writes finished batches to Chroma, in order.
+        in_flight = collections.deque()
+        try:
+            for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                if len(in_flight) >= EMBED_MAX_IN_FLIGHT:
+                    _write_batch(collection, file_id_str, texts,
+                                 metadatas, *in_flight.popleft())
+                # --->>> THIS IS WHERE THE NOMIC EMBEDDING API CALLS HAPPEN <<<---
+                in_flight.append((start, _EMBED_POOL.submit(
+                    emb_func.embed_documents, texts[start:start + EMBED_BATCH_SIZE])))
+            while in_flight:
+                _write_batch(collection, file_id_str, texts,
+                             metadatas, *in_flight.popleft())
+        finally:
+            # On failure, don't leave queued embedding requests running
+            for _, future in in_flight:
+                future.cancel()
 
-        # 4. ADD DOCUMENTS TO CHROMA (POTENTIAL FAILURE POINT B - API CALL)
-        # --->>> THIS IS WHERE THE NOMIC EMBEDDING API CALL HAPPENS <<<---
-        vs.add_documents(docs_to_add)
-        # --->>> ---------------------------------------------- <<<---
         logger.info(
-            f"Successfully added {len(docs_to_add)} chunks for file_id {file_id_str} to Chroma.")
-        return True
+            f"Successfully added {len(texts)} chunks for file_id {file_id_str} to Chroma.")
 
-    except Exception as e:  # Catch errors during load/split or add_documents
+    except Exception as e:  # Catch errors during embedding or Chroma writes
         error_details = CustomException(e, sys)
-        # Errors here might relate to Nomic API key validity, usage limits, PDF processing etc.
+        # Errors here might relate to Nomic API key validity, usage limits etc.
         logger.error(
             f"Error indexing document {file_path} (file_id: {file_id}): {error_details}", exc_info=True)
-        st.error(f"Indexing failed: {e}")  # Show specific error in UI
-        return False  # Explicitly return False on any exception during the process
+        # Drop any batches already written so a failed file leaves no vectors
+        try:
+            with _CHROMA_WRITE_LOCK:
+                collection.delete(where={"file_id": str(file_id)})
+        except Exception as cleanup_e:
+            logger.error(
+                f"Failed to remove partial chunks for file_id {file_id}: {cleanup_e}", exc_info=True)
+        raise DocumentIndexingError(str(e)) from e
 
 
-def delete_doc_from_chroma(file_id: int, nomic_api_key: str) -> bool:
-    emb_func = get_embedding_function(
-        nomic_api_key, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY)
-    vs = get_vector_store(emb_func)
-    if not vs:
-        logger.error("Cannot delete document: Vectorstore not available.")
-        st.error("Vector Store not initialized, cannot delete.")
-        return False
+def delete_doc_from_chroma(file_id: int) -> bool:
+    """Deletes a file's chunks by metadata filter; needs no embedding function or API key."""
     try:
         file_id_str = str(file_id)
         logger.info(
             f"Attempting to delete documents with file_id {file_id_str} from Chroma.")
-        if hasattr(vs, '_collection') and vs._collection:
-            vs._collection.delete(where={"file_id": file_id_str})
-            logger.info(
-                f"Executed delete command for file_id {file_id_str} in Chroma.")
-            return True
-        else:
-            logger.error(
-                "Cannot delete document: Chroma collection attribute not available in vectorstore instance.")
-            st.error(
-                "Internal Error: Could not access vector store collection for deletion.")
-            return False
+        collection = get_raw_collection()
+        with _CHROMA_WRITE_LOCK:
+            collection.delete(where={"file_id": file_id_str})
+        logger.info(
+            f"Executed delete command for file_id {file_id_str} in Chroma.")
+        return True
     except Exception as e:
         error_details = CustomException(e, sys)
         logger.error(
@@ -1,30 +1,30 @@
 # rag_app/utils/db_utils.py
 import sqlite3
+import streamlit as st
 from datetime import datetime
 import os
 import sys
+import atexit
+import threading
+from contextlib import contextmanager
 from pipeline.logger import logger  # Absolute import from package root
 
 DB_DIR = os.path.join(os.getcwd(), "data")
 DB_NAME = "rag_app.db"
 DB_PATH = os.path.join(DB_DIR, DB_NAME)
 
-# Flag to ensure initialization runs only once
-_db_initialized = False
+# Guards the shared connection returned by get_db_connection()
+_db_lock = threading.RLock()
 
 
 def _initialize_database():
     """Creates the database directory and tables if they don't exist."""
-    global _db_initialized
-    if _db_initialized:
-        logger.debug("Database already initialized, skipping.")
-        return
     try:
         logger.info(f"Ensuring database directory exists: {DB_DIR}")
         os.makedirs(DB_DIR, exist_ok=True)
         logger.info(f"Database path set to: {DB_PATH}")
 
-        with get_db_connection() as conn:  # Use the connection function
+        with db_transaction() as conn:  # Use the connection function
             logger.info(
                 "Initializing database tables (if they don't exist)...")
 
@@ -40,6 +40,12 @@ def _initialize_database():
             logger.debug(
                 "Executed CREATE TABLE IF NOT EXISTS for application_logs.")
 
+            # Serves get_chat_history's WHERE session_id = ? ORDER BY created_at
+            conn.execute('''CREATE INDEX IF NOT EXISTS idx_logs_session_created
+                                ON application_logs (session_id, created_at)''')
+            logger.debug(
+                "Executed CREATE INDEX IF NOT EXISTS for application_logs.")
+
             conn.execute('''CREATE TABLE IF NOT EXISTS document_store (
                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                                 filename TEXT UNIQUE,
@@ -50,12 +56,10 @@ def _initialize_database():
             # --- END CORRECT SQL ---
 
             logger.info("Database tables initialization complete.")
-            _db_initialized = True  # Mark as initialized ONLY if successful
 
     except sqlite3.Error as e:
         logger.critical(
             f"Database initialization failed during SQL execution: {e}", exc_info=True)
-        # Don't set _db_initialized = True if it fails
         raise RuntimeError(
             f"Failed to initialize database tables at {DB_PATH}") from e
     except OSError as e:
@@ -70,18 +74,35 @@ def _initialize_database():
             "Unexpected error during database initialization") from e
 
 
+@st.cache_resource(show_spinner=False)
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
+    """Returns the process-wide SQLite connection (opened and configured once)."""
     try:
         conn = sqlite3.connect(DB_PATH, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA journal_mode=WAL;")
+        # Safe with WAL; avoids an fsync on every commit
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        atexit.register(conn.close)
+        logger.info(f"Opened shared database connection to {DB_PATH}")
         return conn
     except sqlite3.Error as e:
         logger.error(
             f"Failed to connect to database at {DB_PATH}: {e}", exc_info=True)
         raise ConnectionError(f"Could not connect to database: {e}") from e
 
+
+@contextmanager
+def db_transaction():
+    """
+    Yields the shared connection inside a transaction (commit on success,
+    rollback on error). The lock keeps Streamlit session threads from
+    interleaving statements on the one connection.
+    """
+    conn = get_db_connection()
+    with _db_lock, conn:
+        yield conn
+
 # --- Keep all other functions ---
 # insert_application_logs, get_chat_history, insert_document_record,
 # delete_document_record, get_all_documents
@@ -91,18 +112,33 @@ def get_db_connection():
 def insert_application_logs(session_id, user_query, gpt_response, model):
     sql = 'INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)'
     try:
-        with get_db_connection() as conn:
+        with db_transaction() as conn:
             conn.execute(sql, (session_id, user_query, gpt_response, model))
         logger.debug(f"Inserted log for session_id: {session_id}")
+        get_chat_history.clear()  # Cached history is stale after a new turn
     except sqlite3.Error as e:
         logger.error(f"Failed to insert application log: {e}", exc_info=True)
 
 
+def insert_application_logs_many(rows):
+    """Inserts (session_id, user_query, gpt_response, model) rows in a single transaction."""
+    sql = 'INSERT INTO application_logs (session_id, user_query, gpt_response, model) VALUES (?, ?, ?, ?)'
+    try:
+        with db_transaction() as conn:
+            conn.executemany(sql, rows)
+        logger.debug(f"Inserted {len(rows)} application logs.")
+        get_chat_history.clear()  # Cached history is stale after new turns
+    except sqlite3.Error as e:
+        logger.error(
+            f"Failed to insert application logs in bulk: {e}", exc_info=True)
+
+
+@st.cache_data(ttl=30, max_entries=256, show_spinner=False)
 def get_chat_history(session_id):
     messages = []
     sql = 'SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at'
     try:
-        with get_db_connection() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(sql, (session_id,))
             for row in cursor.fetchall():
@@ -127,12 +163,13 @@ def insert_document_record(filename):
     sql = 'INSERT INTO document_store (filename) VALUES (?)'
     file_id = None
     try:
-        with get_db_connection() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(sql, (filename,))
             file_id = cursor.lastrowid
             logger.info(
                 f"Inserted document record '{filename}' with ID: {file_id}")
+        get_all_documents.clear()  # Document list changed
     except sqlite3.IntegrityError as e:
         logger.warning(
             f"Failed to insert document record for '{filename}', possibly duplicate: {e}")
@@ -149,7 +186,7 @@ def delete_document_record(file_id):
     sql = 'DELETE FROM document_store WHERE id = ?'
     success = False
     try:
-        with get_db_connection() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(sql, (file_id,))
             if cursor.rowcount > 0:
@@ -160,6 +197,7 @@ def delete_document_record(file_id):
                 logger.warning(
                     f"Attempted to delete document record ID {file_id}, but it was not found.")
                 success = True
+        get_all_documents.clear()  # Document list changed
     except sqlite3.Error as e:
         logger.error(
             f"Failed to delete document record ID {file_id}: {e}", exc_info=True)
@@ -167,11 +205,25 @@ def delete_document_record(file_id):
     return success
 
 
+def document_record_exists(file_id):
+    """Uncached check, safe to call from background threads."""
+    sql = 'SELECT 1 FROM document_store WHERE id = ?'
+    try:
+        with db_transaction() as conn:
+            return conn.execute(sql, (file_id,)).fetchone() is not None
+    except sqlite3.Error as e:
+        logger.error(
+            f"Failed to look up document record ID {file_id}: {e}", exc_info=True)
+        return True  # Assume it exists rather than dropping its vectors
+
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_all_documents():
+    """Cached for reruns; insert/delete_document_record clear it on mutation."""
     documents_data = []
     sql = 'SELECT id, filename, upload_timestamp FROM document_store ORDER BY upload_timestamp DESC'
     try:
-        with get_db_connection() as conn:
+        with db_transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(sql)
             documents_data = [dict(row) for row in cursor.fetchall()]
@@ -180,9 +232,17 @@ def get_all_documents():
         logger.error(f"Failed to retrieve all documents: {e}", exc_info=True)
     return documents_data
 
+
 # --- Explicit Initialization ---
 # Call this ONCE at the start of your streamlit_app.py
 
 
-def ensure_db_initialized():
+@st.cache_resource(show_spinner=False)
+def _initialize_database_once():
+    """Runs _initialize_database() once per process; a failure raises and is retried next call."""
     _initialize_database()
+    return True
+
+
+def ensure_db_initialized():
+    _initialize_database_once()
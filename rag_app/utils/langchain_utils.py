@@ -8,10 +8,9 @@ from langchain.chains import create_history_aware_retriever, create_retrieval_ch
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from typing import Optional
 from langchain_core.runnables import Runnable
-import os
 # Use absolute import for utils and pipeline packages relative to rag_app root
 # Use getter functions
-from utils.chroma_utils import get_vector_store, get_embedding_function
+from utils.chroma_utils import get_vector_store, api_key_fingerprint
 from pipeline.logger import logger
 
 # Define a custom exception for initialization errors
@@ -52,18 +51,28 @@ qa_prompt = ChatPromptTemplate.from_messages([
 ])
 # --- End prompts ---
 
-# --- Cached Resource: RAG Chain ---
-# This function now takes API keys to pass down to resource getters
+# --- Cached Resource: Groq LLM ---
+
+
+@st.cache_resource(show_spinner="Initializing chat model...")
+def _get_llm(model: str, groq_key_hash: str, _groq_api_key: str) -> ChatGroq:
+    """Initializes the Groq chat client once per model/key. Cached on the key hash; `_groq_api_key` is not hashed."""
+    logger.info(f"Cache miss. Initializing ChatGroq LLM (model: {model})...")
+    llm = ChatGroq(model=model, temperature=0, api_key=_groq_api_key)
+    logger.info(f"ChatGroq LLM initialized with model: {model}")
+    return llm
+
+# --- RAG Chain ---
+# Heavy clients (embeddings, vector store, LLM) come from cached getters,
+# so composing the chain per call is cheap.
 
 
-@st.cache_resource(show_spinner="Initializing RAG chain...")
 def get_cached_rag_chain(model: str, nomic_api_key: str, groq_api_key: str) -> Optional[Runnable]:
     """
-    Initializes and returns the RAG chain using cached resources (embedding function and vector store).
+    Composes and returns the RAG chain from cached resources (embedding function, vector store and LLM).
     Requires Nomic and Groq API keys. Returns None if initialization fails.
     """
-    logger.info(
-        f"Cache miss or args changed. Initializing RAG chain (model: {model})...")
+    logger.debug(f"Composing RAG chain (model: {model})...")
 
     # --- Pre-checks ---
     if not nomic_api_key:
@@ -76,29 +85,16 @@ def get_cached_rag_chain(model: str, nomic_api_key: str, groq_api_key: str) -> O
         return None
     # --- --- --- --- ---
 
-    # --- Get Embedding Function and Vector Store using cached getters ---
+    # --- Get Vector Store (and its embedding function) using cached getters ---
     try:
-        logger.debug("Retrieving embedding function...")
-        # Retrieve Nomic config details (could also pass them as args if needed)
-        nomic_model = os.getenv("NOMIC_MODEL_NAME", "nomic-embed-text-v1.5")
-        nomic_dim_str = os.getenv("NOMIC_DIMENSIONALITY")
-        nomic_dim = int(nomic_dim_str) if nomic_dim_str else None
-        embedding_func = get_embedding_function(
-            nomic_api_key, nomic_model, nomic_dim)
-        if embedding_func is None:
-            # Error was already logged/shown by the getter function
-            raise RAGChainInitializationError(
-                "Embedding function initialization failed.")
-
         logger.debug("Retrieving vector store...")
-        vectorstore_instance = get_vector_store(embedding_func)
+        vectorstore_instance = get_vector_store(nomic_api_key)
         if vectorstore_instance is None:
             # Error was already logged/shown by the getter function
             raise RAGChainInitializationError(
                 "Vector store initialization failed.")
 
-        logger.info(
-            "Embedding function and vector store retrieved successfully.")
+        logger.debug("Vector store retrieved successfully.")
 
     except Exception as vs_init_err:
         # Catch potential errors from the getter functions themselves
@@ -112,7 +108,7 @@ def get_cached_rag_chain(model: str, nomic_api_key: str, groq_api_key: str) -> O
     try:
         # Configure retriever settings
         retriever = vectorstore_instance.as_retriever(search_kwargs={"k": 2})
-        logger.info("Retriever created successfully.")
+        logger.debug("Retriever created successfully.")
     except Exception as ret_e:
         logger.error(
             f"Failed to create retriever from vectorstore: {ret_e}", exc_info=True)
@@ -122,23 +118,24 @@ def get_cached_rag_chain(model: str, nomic_api_key: str, groq_api_key: str) -> O
 
     # --- Initialize LLM and Chains ---
     try:
-        # Initialize Groq LLM, passing the key explicitly
-        llm = ChatGroq(model=model, temperature=0, api_key=groq_api_key)
-        logger.info(f"ChatGroq LLM initialized with model: {model}")
+        # Get cached Groq LLM, passing the key explicitly
+        llm = _get_llm(model, api_key_fingerprint(groq_api_key), groq_api_key)
 
-        # Create history-aware retriever chain
+        # Create history-aware retriever chain. It already branches on an empty
+        # chat_history and sends the raw input straight to the retriever, so
+        # first-turn queries skip the rephrase LLM call.
         history_aware_retriever = create_history_aware_retriever(
             llm, retriever, contextualize_q_prompt)
-        logger.info("History-aware retriever chain created.")
+        logger.debug("History-aware retriever chain created.")
 
         # Create final question-answering chain
         question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-        logger.info("Question-answer chain created.")
+        logger.debug("Question-answer chain created.")
 
         # Combine them into the final RAG chain
         rag_chain = create_retrieval_chain(
             history_aware_retriever, question_answer_chain)
-        logger.info("RAG retrieval chain created successfully.")
+        logger.debug("RAG retrieval chain created successfully.")
 
         return rag_chain  # Return the final chain object
 
@@ -0,0 +1,103 @@
+# rag_app/utils/semantic_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import streamlit as st
+from utils.chroma_utils import get_embedding_function, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY
+from pipeline.logger import logger
+
+# --- Semantic Cache Configuration ---
+# Cosine similarity at or above which a cached answer is served
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+# Maximum cached answers kept per scope (oldest are evicted first)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+# Maximum scopes kept at once (least recently used scopes are evicted first)
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "64"))
+# --- --- --- --- --- --- --- --- ---
+
+
+class SemanticCache:
+    """
+    In-process nearest-neighbour cache of RAG answers keyed by prompt embeddings.
+    Vectors are L2-normalised on insert, so a dot product is the cosine similarity.
+    Entries are scoped (e.g. per model) so answers never leak across scopes;
+    both entries per scope and the number of scopes are bounded.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, max_scopes: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._lock = threading.Lock()  # Shared across Streamlit sessions/threads
+        # scope -> (normalised vectors, answers), in least-recently-used order
+        self._scopes: "OrderedDict[str, Tuple[np.ndarray, List[str]]]" = OrderedDict()
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, scope: str, vector: Sequence[float]) -> Optional[str]:
+        """Returns the cached answer of the closest prompt if it clears the threshold."""
+        query = self._normalize(vector)
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None or entry[0].shape[1] != query.shape[0]:
+                return None
+            self._scopes.move_to_end(scope)
+            matrix, answers = entry
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                logger.debug(
+                    f"Semantic cache hit (score {scores[best]:.3f}) for scope {scope}")
+                return answers[best]
+        return None
+
+    def add(self, scope: str, vector: Sequence[float], answer: str) -> None:
+        row = self._normalize(vector)[np.newaxis, :]
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None or entry[0].shape[1] != row.shape[1]:
+                self._scopes[scope] = (row, [answer])
+            else:
+                matrix, answers = entry
+                self._scopes[scope] = (np.vstack([matrix, row])[-self.max_entries:],
+                                       (answers + [answer])[-self.max_entries:])
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops every cached answer (e.g. after the indexed documents change)."""
+        with self._lock:
+            self._scopes.clear()
+        logger.info("Semantic cache cleared.")
+
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache() -> SemanticCache:
+    """Returns the process-wide semantic cache (survives Streamlit reruns)."""
+    logger.info(
+        f"Initializing semantic cache (threshold: {SEMANTIC_CACHE_THRESHOLD}, max entries: {SEMANTIC_CACHE_MAX_ENTRIES}, max scopes: {SEMANTIC_CACHE_MAX_SCOPES})")
+    return SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+                         SEMANTIC_CACHE_MAX_SCOPES)
+
+
+def embed_prompt(prompt: str, nomic_api_key: str) -> Optional[List[float]]:
+    """Embeds a user prompt for cache lookup. Returns None on failure so chat can proceed uncached."""
+    emb_func = get_embedding_function(
+        nomic_api_key, NOMIC_MODEL_NAME, NOMIC_DIMENSIONALITY)
+    if emb_func is None:
+        return None
+    try:
+        return emb_func.embed_query(prompt)
+    except Exception as e:
+        logger.warning(
+            f"Failed to embed prompt for semantic cache, skipping cache: {e}")
+        return None